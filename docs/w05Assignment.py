@@ -7,7 +7,14 @@
 
 import arcade
 import random
-from random import randint
+from math import fabs
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional, without it the physics step runs as plain Python
+    def njit(*args, **kwargs):
+        return lambda func: func
 
 # These are Global constants to use throughout the game
 SCREEN_WIDTH = 400
@@ -21,92 +28,195 @@ MOVE_AMOUNT = 4
 SCORE_HIT = 1
 SCORE_MISS = 5
 
-class Point:
-    '''Point class to represent a point in the coordinate system.'''
-    def __init__(self):
-        '''Initializes Point object with default values.'''
-        self.x = 0.0    # x coordinate location on our window
-        self.y = 0.0    # y coordinate location on our window
+# Speeds above are given per frame at this frame rate, and a single
+# update never moves things further than this many of those frames
+TARGET_FPS = 60
+MAX_FRAME_STEPS = 3.0
+
+# The physics runs at this fixed rate no matter how often the game
+# updates, and the drawing blends between the last two physics steps
+SIM_RATE = 120
+
+# Bits of the key mask for the arrow keys being held down,
+# and which arrow keys set which bit
+KEY_UP = 1
+KEY_DOWN = 2
+_KEY_BITS = {arcade.key.RIGHT: KEY_UP, arcade.key.UP: KEY_UP,
+             arcade.key.LEFT: KEY_DOWN, arcade.key.DOWN: KEY_DOWN}
+
+# One random number generator for the whole game
+_rng = random.Random()
+
+def _randrange_fast(lo, hi, _r=_rng.random):
+    '''Returns a random integer between lo and hi, both included, without going through randint.'''
+    return lo + int(_r() * (hi - lo + 1))
 
-class Velocity:
-    '''Velocity class to represent a velocity in the coordinate system.'''
-    def __init__(self):
-        '''Initializes Velocity object with default values.'''
-        self.dx = 0.0   # how fast it changes in x direction
-        self.dy = 0.0   # how fast it changes in y direction
- 
 class Ball:
     '''Ball class to make a ball appear and move in the window.'''
+    __slots__ = ('x', 'y', 'dx', 'dy')  # position and velocity kept as plain floats, no wrapper objects
+
     def __init__(self):
         '''Initializes Ball object along the left edge of the screen, and with a random velocity.'''
-        self.center = Point() 
-        self.center.x = BALL_RADIUS  # make sure half of the ball is not outside the screen
-        self.center.y = randint(BALL_RADIUS, SCREEN_HEIGHT - BALL_RADIUS) # random y coordinate, but make sure
+        self.x = float(BALL_RADIUS)  # make sure half of the ball is not outside the screen
+        self.y = float(_randrange_fast(BALL_RADIUS, SCREEN_HEIGHT - BALL_RADIUS)) # random y coordinate, but make sure
         # the ball is within the screen
-        self.velocity = Velocity()
-        self.velocity.dx = randint(MOVE_AMOUNT, 2*MOVE_AMOUNT)  
-        self.velocity.dy = randint(MOVE_AMOUNT-2, MOVE_AMOUNT-1)  # make sure not the same speed as dx or paddle
+        self.dx = float(_randrange_fast(MOVE_AMOUNT, 2*MOVE_AMOUNT))  # how fast it changes in x direction
+        self.dy = float(_randrange_fast(MOVE_AMOUNT-2, MOVE_AMOUNT-1))  # make sure not the same speed as dx or paddle
         # would not need to move to catch the ball
 
-    def draw(self):
-        '''Draws a circle (ball) with a center at: x = self.center.x, y = self.center.y.'''
-        arcade.draw_circle_filled(self.center.x, self.center.y, BALL_RADIUS, arcade.color.BURGUNDY)
-    
-    def advance(self):
-        '''Advances the circle based on velocity for 1 frame.'''
-        self.center.x +=self.velocity.dx
-        self.center.y +=self.velocity.dy
-
-    def bounce_horizontal(self):
-        '''Inverts to switch horizontal direction of the ball if the ball hits the wall to the left.'''
-        self.velocity.dx *= -1
-    
-    def bounce_vertical(self):
-        '''Inverts to switch vertical direction of the ball if the ball hits the wall above or below.'''
-        self.velocity.dy *= -1
-
     def restart(self):
         '''Resets ball's position after the ball is lost.'''
-        self.center.x = 0.0
-        self.center.y = randint(BALL_RADIUS, SCREEN_HEIGHT - BALL_RADIUS)
-        self.velocity.dx = randint(MOVE_AMOUNT, 2*MOVE_AMOUNT) # positive, want to move right
-        self.velocity.dy = randint(MOVE_AMOUNT-2, MOVE_AMOUNT-1) 
+        self.x = 0.0
+        self.y = float(_randrange_fast(BALL_RADIUS, SCREEN_HEIGHT - BALL_RADIUS))
+        self.dx = float(_randrange_fast(MOVE_AMOUNT, 2*MOVE_AMOUNT)) # positive, want to move right
+        self.dy = float(_randrange_fast(MOVE_AMOUNT-2, MOVE_AMOUNT-1)) 
  
 
  
 class Paddle:
     '''Paddle class to make a paddle appear and move in the window.'''
+    __slots__ = ('x', 'y')
+
     def __init__(self):
         '''Initializes Paddle object.'''
-        self.center = Point()
-        self.center.x = SCREEN_WIDTH-PADDLE_WIDTH  # make sure paddle is does not dissappear off the window
-        self.center.y = SCREEN_HEIGHT / 2  
-        
-    def draw(self):
-        '''Creates a black rectangle (paddle) with a center at: x = self.center.x, y = self.center.y.'''
-        arcade.draw_rectangle_filled(self.center.x, self.center.y,PADDLE_WIDTH, PADDLE_HEIGHT, 
-                                     arcade.color.BLACK)
-    
-    def move_up(self):
-        '''Moves the paddle up.'''
-        if self.center.y < SCREEN_HEIGHT - PADDLE_HEIGHT / 2: # make sure the paddle stops moving up as 
-            # soon as it goes off the window
-            self.center.y += MOVE_AMOUNT
-        
-    
-    def move_down(self):
-        '''Moves the paddle down.'''
-        if self.center.y > PADDLE_HEIGHT / 2: # make sure the paddle stops moving down as soon as
-            # it goes off the window
-            self.center.y -= MOVE_AMOUNT
+        self.x = float(SCREEN_WIDTH-PADDLE_WIDTH)  # make sure paddle is does not dissappear off the window
+        self.y = SCREEN_HEIGHT / 2
+
+    def move(self, delta, _lo=PADDLE_HEIGHT / 2, _hi=SCREEN_HEIGHT - PADDLE_HEIGHT / 2):
+        '''Moves the paddle up (positive delta) or down (negative delta), but not off the window.'''
+        y = self.y + delta
+        self.y = _lo if y < _lo else _hi if y > _hi else y
+
+
+@njit(cache=True, fastmath=True)
+def _step(bx, by, dx, dy, px, py, dt, SW, SH, BR, too_close_x, too_close_y, _fabs=fabs):
+    '''
+    Moves the ball forward by dt frames and checks it against the paddle and
+    the borders of the screen. The constants, including how close the ball
+    has to get to the paddle to hit it, are passed in so the compiled
+    version does not depend on module globals, and _fabs should be left at
+    its default.
+    :return: the new bx, by, dx, dy, whether the paddle was hit and
+        whether the ball was missed
+    '''
+    bx += dx * dt
+    by += dy * dt
+
+    if bx > SW:
+        # the ball got past the paddle, the caller restarts it
+        return bx, by, dx, dy, False, True
+
+    hit = False
+    # most frames the ball is well to the left of the paddle or moving away
+    # from it, so rule that out with one compare before the full test
+    if bx >= px - too_close_x and dx > 0:
+        if _fabs(bx - px) < too_close_x and _fabs(by - py) < too_close_y:
+            # we are too close and moving right, this is a hit!
+            dx = -dx
+            hit = True
+
+    # bounce off the borders of the screen, the comparisons give 0 or 1
+    # so the sign is flipped by multiplying instead of branching
+    dx *= 1 - 2 * ((bx < BR) & (dx < 0))
+    dy *= 1 - 2 * (((by < BR) & (dy < 0)) | ((by > SH - BR) & (dy > 0)))
+
+    return bx, by, dx, dy, hit, False
+
+
+def simulate_batch(n_steps, balls, paddle_y=SCREEN_HEIGHT / 2, rng=None, dt=TARGET_FPS / SIM_RATE):
+    '''
+    Runs the ball physics for many balls at once without opening a window,
+    for replays, fast-forward or testing paddle strategies. Needs numpy,
+    which the game itself does not.
+    :param n_steps: how many physics steps to advance
+    :param balls: float array of shape (4, N) holding the rows x, y, dx, dy;
+        it is updated in place
+    :param paddle_y: where the paddle sits, a number or an array of N values
+    :param rng: numpy Generator used to restart missed balls
+    :param dt: how many frames each step moves the balls, by default the
+        same fixed physics step the game uses
+    :return: array with the score of each ball
+    '''
+    import numpy as np
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    x, y, dx, dy = balls
+    scores = np.zeros(x.shape[0], dtype=np.int64)
+    paddle_x = SCREEN_WIDTH - PADDLE_WIDTH
+    too_close_x = (PADDLE_WIDTH / 2) + BALL_RADIUS
+    too_close_y = (PADDLE_HEIGHT / 2) + BALL_RADIUS
+
+    for _ in range(n_steps):
+        x += dx * dt
+        y += dy * dt
+
+        # balls that got past the paddle lose points and start over
+        miss = x > SCREEN_WIDTH
+        n_miss = np.count_nonzero(miss)
+        if n_miss:
+            scores[miss] -= SCORE_MISS
+            x[miss] = 0.0
+            y[miss] = rng.integers(BALL_RADIUS, SCREEN_HEIGHT - BALL_RADIUS, n_miss, endpoint=True)
+            dx[miss] = rng.integers(MOVE_AMOUNT, 2*MOVE_AMOUNT, n_miss, endpoint=True)
+            dy[miss] = rng.integers(MOVE_AMOUNT-2, MOVE_AMOUNT-1, n_miss, endpoint=True)
+
+        hit = ((np.abs(x - paddle_x) < too_close_x) & (np.abs(y - paddle_y) < too_close_y) &
+               (dx > 0) & ~miss)
+        scores += hit * SCORE_HIT
+        np.negative(dx, out=dx, where=hit)
+
+        # bounce off the borders of the screen
+        np.negative(dx, out=dx, where=(x < BALL_RADIUS) & (dx < 0))
+        np.negative(dy, out=dy, where=((y < BALL_RADIUS) & (dy < 0)) |
+                                      ((y > SCREEN_HEIGHT - BALL_RADIUS) & (dy > 0)))
+
+    return scores
+
+
+# Source of Pong's per-frame update. Pong.__init__ fills in the constants
+# as literals and compiles it, so the update never looks up a global.
+_UPDATE_SRC = '''
+def _update(self, delta_time):
+    # Run the physics in fixed steps, carrying the time left over to the
+    # next frame. A hitch is clamped so it cannot queue up a long burst of
+    # steps or let the ball jump past the paddle
+    acc = self._accumulator + min(delta_time, {MAX_FRAME_TIME})
+    ball = self.ball
+    paddle = self.paddle
+
+    while acc >= {SIM_DT}:
+        acc -= {SIM_DT}
+
+        # remember where the ball was so drawing can blend between steps
+        self._prev_x = ball.x
+        self._prev_y = ball.y
+
+        # Move the ball forward in time
+        # and check it at the important places
+        ball.x, ball.y, ball.dx, ball.dy, hit, miss = _step(ball.x, ball.y, ball.dx, ball.dy,
+                                                           paddle.x, paddle.y, {SIM_FRAMES},
+                                                           {SCREEN_WIDTH}, {SCREEN_HEIGHT}, {BALL_RADIUS},
+                                                           {TOO_CLOSE_X}, {TOO_CLOSE_Y})
+        if hit:
+            self.score += {SCORE_HIT}
+
+        if miss:
+            # We missed!
+            self.score -= {SCORE_MISS}
+            ball.restart()
+            self._prev_x = ball.x
+            self._prev_y = ball.y
+
+    self._accumulator = acc
+'''
 
 
 class Pong(arcade.Window):
     """
     This class handles all the game callbacks and interaction
     It assumes the following classes exist:
-        Point
-        Velocity
         Ball
         Paddle
     This class will then call the appropriate functions of
@@ -127,10 +237,43 @@ class Pong(arcade.Window):
         self.paddle = Paddle()
         self.score = 0
 
-        # These are used to see if the user is
-        # holding down the arrow keys
-        self.holding_left = False
-        self.holding_right = False
+        # This is used to see if the user is
+        # holding down the arrow keys, one bit per direction
+        self._key_mask = 0
+
+        # The ball and paddle are drawn as sprites that are created once,
+        # on every frame only their positions are updated
+        self._ball_sprite = arcade.SpriteCircle(BALL_RADIUS, arcade.color.BURGUNDY)
+        self._paddle_sprite = arcade.SpriteSolidColor(PADDLE_WIDTH, PADDLE_HEIGHT, arcade.color.BLACK)
+        self._sprite_list = arcade.SpriteList()
+        self._sprite_list.append(self._ball_sprite)
+        self._sprite_list.append(self._paddle_sprite)
+
+        # The score text is laid out once and only changed when the score does
+        self._score_text = arcade.Text("Score: 0", 10, SCREEN_HEIGHT - 20, arcade.color.WHITE, 12)
+        self._last_score = 0
+
+        # Time not yet simulated, and where the ball was before the last physics step
+        self._accumulator = 0.0
+        self._prev_x = self.ball.x
+        self._prev_y = self.ball.y
+
+        # Build the per-frame update with the game constants baked in, including
+        # how close the ball has to get to the paddle to hit it, and with
+        # everything handed to _step as a float so it only ever sees one signature
+        constants = dict(MAX_FRAME_TIME=MAX_FRAME_STEPS / TARGET_FPS, SIM_DT=1 / SIM_RATE,
+                         SIM_FRAMES=TARGET_FPS / SIM_RATE, SCREEN_WIDTH=float(SCREEN_WIDTH),
+                         SCREEN_HEIGHT=float(SCREEN_HEIGHT), BALL_RADIUS=float(BALL_RADIUS),
+                         TOO_CLOSE_X=(PADDLE_WIDTH / 2) + BALL_RADIUS,
+                         TOO_CLOSE_Y=(PADDLE_HEIGHT / 2) + BALL_RADIUS,
+                         SCORE_HIT=SCORE_HIT, SCORE_MISS=SCORE_MISS)
+        namespace = {'_step': _step, 'min': min}
+        exec(_UPDATE_SRC.format(**{name: repr(value) for name, value in constants.items()}), namespace)
+        self._update = namespace['_update'].__get__(self, Pong)
+
+        # Call _step once with all-float arguments so numba compiles it (or
+        # loads it from its cache) now rather than in the middle of play
+        _step(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
 
         arcade.set_background_color(arcade.color.BRITISH_RACING_GREEN)
 
@@ -143,9 +286,15 @@ class Pong(arcade.Window):
         # clear the screen to begin drawing
         arcade.start_render()
 
-        # draw each object
-        self.ball.draw()
-        self.paddle.draw()
+        # move the sprites to where the objects are and draw them, placing
+        # the ball between its last two physics steps by how far the
+        # unsimulated time has got towards the next one
+        alpha = self._accumulator * SIM_RATE
+        self._ball_sprite.center_x = self._prev_x + (self.ball.x - self._prev_x) * alpha
+        self._ball_sprite.center_y = self._prev_y + (self.ball.y - self._prev_y) * alpha
+        self._paddle_sprite.center_x = self.paddle.x
+        self._paddle_sprite.center_y = self.paddle.y
+        self._sprite_list.draw()
 
         self.draw_score()
 
@@ -153,79 +302,30 @@ class Pong(arcade.Window):
         """
         Puts the current score on the screen
         """
-        score_text = "Score: {}".format(self.score)
-        start_x = 10
-        start_y = SCREEN_HEIGHT - 20
-        arcade.draw_text(score_text, start_x=start_x, start_y=start_y, font_size=12, color=arcade.color.WHITE)
+        if self._last_score != self.score:
+            self._score_text.text = f"Score: {self.score}"
+            self._last_score = self.score
+
+        self._score_text.draw()
 
     def update(self, delta_time):
         """
         Update each object in the game.
         :param delta_time: tells us how much time has actually elapsed
         """
+        self._update(delta_time)
 
-        # Move the ball forward one element in time
-        self.ball.advance()
-
-        # Check to see if keys are being held, and then
-        # take appropriate action
-        self.check_keys()
-
-        # check for ball at important places
-        self.check_miss()
-        self.check_hit()
-        self.check_bounce()
-
-    def check_hit(self):
+    def _paddle_tick(self, delta_time):
         """
-        Checks to see if the ball has hit the paddle
-        and if so, calls its bounce method.
-        :return:
-        """
-        too_close_x = (PADDLE_WIDTH / 2) + BALL_RADIUS
-        too_close_y = (PADDLE_HEIGHT / 2) + BALL_RADIUS
-
-        if (abs(self.ball.center.x - self.paddle.center.x) < too_close_x and
-                    abs(self.ball.center.y - self.paddle.center.y) < too_close_y and
-                    self.ball.velocity.dx > 0):
-            # we are too close and moving right, this is a hit!
-            self.ball.bounce_horizontal()
-            self.score += SCORE_HIT
-
-    def check_miss(self):
-        """
-        Checks to see if the ball went past the paddle
-        and if so, restarts it.
-        """
-        if self.ball.center.x > SCREEN_WIDTH:
-            # We missed!
-            self.score -= SCORE_MISS
-            self.ball.restart()
-
-    def check_bounce(self):
-        """
-        Checks to see if the ball has hit the borders
-        of the screen and if so, calls its bounce methods.
-        """
-        if self.ball.center.x < BALL_RADIUS and self.ball.velocity.dx < 0:
-            self.ball.bounce_horizontal()
-
-        if self.ball.center.y < BALL_RADIUS and self.ball.velocity.dy < 0:
-            self.ball.bounce_vertical()
-
-        if self.ball.center.y > SCREEN_HEIGHT - BALL_RADIUS and self.ball.velocity.dy > 0:
-            self.ball.bounce_vertical()
-
-    def check_keys(self):
-        """
-        Checks to see if the user is holding down an
-        arrow key, and if so, takes appropriate action.
+        Moves the paddle for the arrow keys being held down. Only
+        scheduled while at least one of them is, so nothing runs
+        for the paddle when no key is held.
+        :param delta_time: tells us how much time has actually elapsed
         """
-        if self.holding_left:
-            self.paddle.move_down()
+        m = self._key_mask
+        delta = (m & KEY_UP) - ((m & KEY_DOWN) >> 1)  # 1 for up, -1 for down, 0 for none or both
 
-        if self.holding_right:
-            self.paddle.move_up()
+        self.paddle.move(MOVE_AMOUNT * delta * min(delta_time * TARGET_FPS, MAX_FRAME_STEPS))
 
     def on_key_press(self, key, key_modifiers):
         """
@@ -234,11 +334,12 @@ class Pong(arcade.Window):
         :param key: The key that was pressed
         :param key_modifiers: Things like shift, ctrl, etc
         """
-        if key == arcade.key.LEFT or key == arcade.key.DOWN:
-            self.holding_left = True
+        held = self._key_mask
+        self._key_mask = held | _KEY_BITS.get(key, 0)
 
-        if key == arcade.key.RIGHT or key == arcade.key.UP:
-            self.holding_right = True
+        if not held and self._key_mask:
+            # the first arrow key went down, start moving the paddle
+            arcade.schedule(self._paddle_tick, 1 / TARGET_FPS)
 
     def on_key_release(self, key, key_modifiers):
         """
@@ -247,12 +348,15 @@ class Pong(arcade.Window):
         :param key: The key that was pressed
         :param key_modifiers: Things like shift, ctrl, etc
         """
-        if key == arcade.key.LEFT or key == arcade.key.DOWN:
-            self.holding_left = False
-
-        if key == arcade.key.RIGHT or key == arcade.key.UP:
-            self.holding_right = False
-
-# Creates the game and starts it going
-window = Pong(SCREEN_WIDTH, SCREEN_HEIGHT)
-arcade.run()
\ No newline at end of file
+        held = self._key_mask
+        self._key_mask = held & ~_KEY_BITS.get(key, 0)
+
+        if held and not self._key_mask:
+            # the last arrow key came up, stop moving the paddle
+            arcade.unschedule(self._paddle_tick)
+
+# Creates the game and starts it going, but not when the
+# module is only imported, e.g. to time or test the physics
+if __name__ == "__main__":
+    window = Pong(SCREEN_WIDTH, SCREEN_HEIGHT)
+    arcade.run()